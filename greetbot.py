@@ -13,12 +13,15 @@ import re
 import threading
 import time
 import traceback
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from datetime import datetime, timedelta
-from typing import Dict, Iterator, List, Optional, Set, cast, TypedDict
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, DefaultDict, Dict, Iterator, List, Optional, Pattern, Set, Tuple, cast, TypedDict
 
 import pytz
 from redis import Redis
+from redis.exceptions import ResponseError
 
 import pywikibot
 from pywikibot.bot import SingleSiteBot
@@ -29,24 +32,70 @@ timezone = pytz.timezone("Europe/Berlin")
 
 inProduction = True
 
+# maximum number of titles/users per API query for accounts without apihighlimits
+apiBatchSize = 50
+
+# greeting and control group infos are kept in Redis for 90 days
+userInfoExpirySeconds = 90 * 24 * 60 * 60
+
+# matches every line starting with "#", group 1 is only set for lines with a signature and a timestamp
+greeterLineRegex = re.compile(
+    r"^#(?:\s*(.+) [0-9]{2}:[0-9]{2}, [123]?[0-9]\. (?:Jan\.|Feb\.|Mär\.|Apr\.|Mai|Jun\.|Jul\.|Aug\.|Sep\.|Okt\.|Nov\.|Dez\.) 2[0-9]{3} \((CES?T|MES?Z)\).*|.*)$",
+    re.MULTILINE,
+)
+teamSectionHeaderRegex = re.compile(r"^==\s*Begrüßungsteam\s*==", re.MULTILINE)
+notifySectionHeaderRegex = re.compile(r"^===\s*Benachrichtigung über Antworten\s*===", re.MULTILINE)
+notifyLineRegex = re.compile(r"^\*.*$", re.MULTILINE)
+headingRegex = re.compile(r"^=", re.MULTILINE)
+# lines of the group pages, group 1 is the user name
+groupLineRegex = re.compile(r"^\* \[\[Benutzer:([^|\]]+)\|", re.MULTILINE)
+# links to a user page, user talk page or the contributions of a user as used in signatures,
+# group 1 is the user name, links to subpages or with HTML entities in the user name are not matched
+signatureUserLinkRegex = re.compile(
+    r"\[\[\s*(?i:Benutzer(?:in)?(?:[ _]Diskussion)?\s*:|Spezial\s*:\s*Beiträge/)\s*([^|\]/#&]+?)\s*(?:#[^|\]]*)?(?:\||\]\])"
+)
+# prefixes of links that may point to user (talk) pages or special pages, including namespace aliases,
+# also behind interwiki or language prefixes like [[:de:Benutzer:X]] or [[w:User:X]], which Link.parse resolves
+userLinkPrefixRegex = re.compile(
+    r"\s*:?\s*(?:[\w-]+\s*:\s*)*?(?:Benutzer(?:in)?(?:[ _]Diskussion)?|BD|BN|User(?:[ _]talk)?|Spezial|Special)\s*:",
+    re.IGNORECASE,
+)
+
+
+_dateStringCache: Optional[Tuple[date, str]] = None
+
 
 def getDateString() -> str:
+    global _dateStringCache
     localizedTime = datetime.now(timezone)
+    if _dateStringCache and _dateStringCache[0] == localizedTime.date():
+        return _dateStringCache[1]
     if os.name == "nt":
-        return localizedTime.strftime("%e").replace(" ", "") + localizedTime.strftime(". %B %Y")
+        dateString = localizedTime.strftime("%e").replace(" ", "") + localizedTime.strftime(". %B %Y")
     else:
-        return localizedTime.strftime("%-d. %B %Y")
+        dateString = localizedTime.strftime("%-d. %B %Y")
+    _dateStringCache = (localizedTime.date(), dateString)
+    return dateString
 
 
 def ensureDateSectionExists(text: str) -> str:
     currentDateSection = f"=== {getDateString()} ==="
-    if not currentDateSection in text:
+    # entries are only appended, so the current date section is normally the last one and found by a short backward scan
+    lastDateSectionStart = text.rfind("\n=== ") + 1
+    if lastDateSectionStart and text.startswith(currentDateSection, lastDateSectionStart):
+        return text
+    if currentDateSection not in text:
         text += f"\n<noinclude>\n{currentDateSection}</noinclude>"
     return text
 
 
-def FaultTolerantLiveRCPageGenerator(site: pywikibot.site.BaseSite) -> Iterator[pywikibot.Page]:
+def FaultTolerantLiveRCPageGenerator(
+    site: pywikibot.site.BaseSite, acceptEntry: Optional[Callable[[Dict[str, Any]], bool]] = None
+) -> Iterator[pywikibot.Page]:
     for entry in site_rc_listener(site):
+        # entries rejected by the caller are dropped before the page is instantiated
+        if acceptEntry and not acceptEntry(entry):
+            continue
         # The title in a log entry may have been suppressed
         if "title" not in entry and entry["type"] == "log":
             continue
@@ -64,9 +113,31 @@ def FaultTolerantLiveRCPageGenerator(site: pywikibot.site.BaseSite) -> Iterator[
         yield page
 
 
+def chunked(items: List[pywikibot.User], size: int = apiBatchSize) -> Iterator[List[pywikibot.User]]:
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+def getSectionText(text: str, sectionHeaderRegex: Pattern[str]) -> str:
+    # returns the lines after the first header matched by sectionHeaderRegex up to the next header
+    header = sectionHeaderRegex.search(text)
+    if not header:
+        return ""
+    sectionStart = text.find("\n", header.end())
+    if sectionStart == -1:
+        return ""
+    nextHeading = headingRegex.search(text, sectionStart + 1)
+    return text[sectionStart + 1 : nextHeading.start() if nextHeading else len(text)]
+
+
 def getUserFromSignature(site: pywikibot.site.BaseSite, text: str) -> Optional[pywikibot.User]:
     for wikilink in pywikibot.link_regex.finditer(text):
-        if not wikilink.group("title").strip():
+        # the common link forms are recognized without pywikibot's comparatively expensive link parsing
+        match = signatureUserLinkRegex.match(wikilink.group(0))
+        if match:
+            return pywikibot.User(site, match.group(1))
+        if not userLinkPrefixRegex.match(wikilink.group("title")):
+            # cannot be a link to a user (talk) page or to the contributions of a user
             continue
         try:
             link = pywikibot.Link(wikilink.group("title"), source=site)
@@ -100,10 +171,31 @@ def ensureHeaderForLogExists(text: str, greeter: str) -> str:
     return text
 
 
+def ensureIncludedAsTemplates(
+    mainLogPage: pywikibot.Page, subLogPageTitles: List[str], text: Optional[str] = None
+) -> Optional[str]:
+    # returns the saved text or None if the page did not have to be saved,
+    # text can be passed if the current text is already known
+    if text is None:
+        text = mainLogPage.get(force=True)
+    missingTitles: List[str] = []
+    for subLogPageTitle in subLogPageTitles:
+        if f"{{{subLogPageTitle}}}" not in text and subLogPageTitle not in missingTitles:
+            missingTitles.append(subLogPageTitle)
+    if missingTitles:
+        newText = "".join([text] + [f"\n{{{{{subLogPageTitle}}}}}" for subLogPageTitle in missingTitles])
+        mainLogPage.text = newText
+        if len(missingTitles) == 1:
+            summary = f"Bot: Unterseite [[{missingTitles[0]}]] eingebunden."
+        else:
+            summary = f"Bot: Unterseiten {', '.join(f'[[{title}]]' for title in missingTitles)} eingebunden."
+        mainLogPage.save(summary=summary)
+        return newText
+    return None
+
+
 def ensureIncludedAsTemplate(mainLogPage: pywikibot.Page, subLogPageTitle: str) -> None:
-    if not f"{{{subLogPageTitle}}}" in mainLogPage.get(force=True):
-        mainLogPage.text = mainLogPage.text + f"\n{{{{{subLogPageTitle}}}}}"
-        mainLogPage.save(summary=f"Bot: Unterseite [[{subLogPageTitle}]] eingebunden.")
+    ensureIncludedAsTemplates(mainLogPage, [subLogPageTitle])
 
 
 GreetedUserInfo = TypedDict("GreetedUserInfo", {"greeter": str, "normalEditSeen": str, "time": str})
@@ -114,6 +206,35 @@ class RedisDb:
     def __init__(self, secret: str) -> None:
         self.secret = secret
         self.redis = Redis(host="tools-redis" if os.name != "nt" else "localhost", decode_responses=True)
+        # sorted sets of user names scored by the time of greeting or assignment,
+        # entries older than the expiry of the user infos are trimmed whenever a user is added
+        self.greetedUsersKey = f"{secret}:greetedUsersByTime"
+        self.controlGroupKey = f"{secret}:controlGroupByTime"
+        # local copy of the greeted users for the watch bot, may still contain users whose info has expired
+        self.greetedUsersCache: Set[str] = set()
+        self.greetedUsersCacheTime: Optional[float] = None
+        self.greetedUsersCacheNewest = 0.0
+        self.greetedUsersCacheLock = threading.Lock()
+        # stores the greeting, sets its expiry and adds the user to the greeted users in one call
+        self.addGreetedUserScript = self.redis.register_script(  # type: ignore
+            """
+            redis.call('HSET', KEYS[1], 'greeter', ARGV[1], 'normalEditSeen', '0', 'time', ARGV[2])
+            redis.call('EXPIRE', KEYS[1], ARGV[3])
+            redis.call('ZADD', KEYS[2], ARGV[2], ARGV[4])
+            redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', '(' .. (tonumber(ARGV[2]) - tonumber(ARGV[3])))
+            """
+        )
+        # keeps the time and expiry of the first assignment if the user is already in the control group,
+        # the user's score in the control group is always the time stored in the user info
+        self.addControlGroupUserScript = self.redis.register_script(  # type: ignore
+            """
+            if redis.call('HSETNX', KEYS[1], 'time', ARGV[1]) == 1 then
+                redis.call('EXPIRE', KEYS[1], ARGV[2])
+            end
+            redis.call('ZADD', KEYS[2], redis.call('HGET', KEYS[1], 'time'), ARGV[3])
+            redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', '(' .. (tonumber(ARGV[1]) - tonumber(ARGV[2])))
+            """
+        )
 
     def getGreetedUserKey(self, greetedUser: str) -> str:
         return f"{self.secret}:greetedUser:{greetedUser}"
@@ -122,29 +243,24 @@ class RedisDb:
         return f"{self.secret}:controlGroup:{greetedUser}"
 
     def addGreetedUser(self, greeter: str, user: str) -> None:
-        key = self.getGreetedUserKey(user)
-        p = self.redis.pipeline()  # type: ignore
-        p.hset(key, "greeter", greeter)
-        p.hset(key, "normalEditSeen", "0")
-        p.hset(key, "time", int(datetime.utcnow().timestamp()))
-        p.expire(key, timedelta(days=90))
-        p.sadd(f"{self.secret}:greetedUsers", user)
-        p.execute()
+        self.addGreetedUserScript(
+            keys=[self.getGreetedUserKey(user), self.greetedUsersKey],
+            args=[greeter, int(datetime.utcnow().timestamp()), userInfoExpirySeconds, user],
+        )
+        with self.greetedUsersCacheLock:
+            self.greetedUsersCache.add(user)
 
     def addControlGroupUser(self, user: str) -> None:
-        key = self.getControlGroupUserKey(user)
-        if not self.redis.exists(key):  # type: ignore
-            p = self.redis.pipeline()  # type: ignore
-            p.hset(key, "time", int(datetime.utcnow().timestamp()))
-            p.expire(key, timedelta(days=90))
-            p.sadd(f"{self.secret}:controlGroup", user)
-            p.execute()
+        self.addControlGroupUserScript(
+            keys=[self.getControlGroupUserKey(user), self.controlGroupKey],
+            args=[int(datetime.utcnow().timestamp()), userInfoExpirySeconds, user],
+        )
 
     def getGreetedUserInfo(self, user: str) -> GreetedUserInfo:
         return self.redis.hgetall(self.getGreetedUserKey(user))  # type: ignore
 
-    def setGreetedUserInfo(self, user: str, newUserInfo: GreetedUserInfo) -> None:
-        self.redis.hmset(self.getGreetedUserKey(user), newUserInfo)  # type: ignore
+    def markNormalEditSeen(self, user: str) -> None:
+        self.redis.hset(self.getGreetedUserKey(user), "normalEditSeen", "1")  # type: ignore
 
     def removeGreetedUser(self, user: str) -> None:
         self.redis.delete(self.getGreetedUserKey(user))  # type: ignore
@@ -152,15 +268,81 @@ class RedisDb:
     def getControlGroupUserInfo(self, user: str) -> ControlGroupUserInfo:
         return self.redis.hgetall(self.getControlGroupUserKey(user))  # type: ignore
 
+    def getGreetedUserInfos(self, users: List[str]) -> List[GreetedUserInfo]:
+        p = self.redis.pipeline(transaction=False)  # type: ignore
+        for user in users:
+            p.hgetall(self.getGreetedUserKey(user))
+        return cast(List[GreetedUserInfo], p.execute())
+
+    def getControlGroupUserInfos(self, users: List[str]) -> List[ControlGroupUserInfo]:
+        p = self.redis.pipeline(transaction=False)  # type: ignore
+        for user in users:
+            p.hgetall(self.getControlGroupUserKey(user))
+        return cast(List[ControlGroupUserInfo], p.execute())
+
     def getAllGreetedUsers(self) -> List[str]:
-        return cast(List[str], self.redis.smembers(f"{self.secret}:greetedUsers"))  # type: ignore
+        cutoff = int(datetime.utcnow().timestamp()) - userInfoExpirySeconds
+        return cast(List[str], self.redis.zrangebyscore(self.greetedUsersKey, f"({cutoff}", "+inf"))  # type: ignore
 
     def getAllControlGroupUsers(self) -> List[str]:
-        return cast(List[str], self.redis.smembers(f"{self.secret}:controlGroup"))  # type: ignore
+        cutoff = int(datetime.utcnow().timestamp()) - userInfoExpirySeconds
+        return cast(List[str], self.redis.zrangebyscore(self.controlGroupKey, f"({cutoff}", "+inf"))  # type: ignore
+
+    def isPossiblyGreetedUser(self, user: str, maxAge: float = 10) -> bool:
+        # getGreetedUserInfo has the final say for users in the cache
+        with self.greetedUsersCacheLock:
+            if self.greetedUsersCacheTime is None or time.monotonic() - self.greetedUsersCacheTime >= maxAge:
+                # only users greeted since the newest cached greeting are transferred,
+                # with a minute of overlap for clock differences between the bot processes
+                newGreetings = self.redis.zrangebyscore(  # type: ignore
+                    self.greetedUsersKey, self.greetedUsersCacheNewest - 60, "+inf", withscores=True
+                )
+                for (greetedUser, greetingTime) in newGreetings:
+                    self.greetedUsersCache.add(greetedUser)
+                    self.greetedUsersCacheNewest = max(self.greetedUsersCacheNewest, greetingTime)
+                self.greetedUsersCacheTime = time.monotonic()
+            return user in self.greetedUsersCache
+
+    def getGreetRunCursor(self) -> Optional[datetime]:
+        # end (UTC) of the registration window handled by the last successful greet run
+        cursor = self.redis.get(f"{self.secret}:greetRunCursor")  # type: ignore
+        return datetime.fromisoformat(cursor) if cursor else None
+
+    def setGreetRunCursor(self, cursor: datetime) -> None:
+        self.redis.set(f"{self.secret}:greetRunCursor", cursor.isoformat())  # type: ignore
+
+    def migrateUserGroups(self) -> None:
+        # moves the users from the plain sets used before the time was kept as score, expired users are dropped,
+        # the old set is renamed first so that no user added to it concurrently is lost by the final delete,
+        # a migration that was interrupted is continued from the renamed set
+        for (oldKey, newKey, getUserKey) in [
+            (f"{self.secret}:greetedUsers", self.greetedUsersKey, self.getGreetedUserKey),
+            (f"{self.secret}:controlGroup", self.controlGroupKey, self.getControlGroupUserKey),
+        ]:
+            migratingKey = f"{oldKey}:migrating"
+            try:
+                self.redis.rename(oldKey, migratingKey)  # type: ignore
+            except ResponseError:
+                # old set does not exist (any more)
+                pass
+            users = list(self.redis.smembers(migratingKey))  # type: ignore
+            if not users:
+                continue
+            p = self.redis.pipeline(transaction=False)  # type: ignore
+            for user in users:
+                p.hget(getUserKey(user), "time")
+            scores = {user: int(userTime) for (user, userTime) in zip(users, p.execute()) if userTime}
+            if scores:
+                self.redis.zadd(newKey, scores, nx=True)  # type: ignore
+            self.redis.delete(migratingKey)  # type: ignore
 
     def deleteUserGroups(self) -> None:
         self.redis.delete(f"{self.secret}:greetedUsers")  # type: ignore
         self.redis.delete(f"{self.secret}:controlGroup")  # type: ignore
+        self.redis.delete(f"{self.secret}:greetedUsers:migrating")  # type: ignore
+        self.redis.delete(f"{self.secret}:controlGroup:migrating")  # type: ignore
+        self.redis.delete(self.greetedUsersKey)  # type: ignore
+        self.redis.delete(self.controlGroupKey)  # type: ignore
 
 
 class TalkPageExistsException(Exception):
@@ -171,15 +353,81 @@ class TalkPageExistsException(Exception):
 class Greeter:
     user: pywikibot.User
     signatureWithoutTimestamp: str
+    talkPagePrefix: str
+
+
+class ProjectPage:
+    # the team page of the project, fetched and parsed once for the greet controller and the watch bot
+    def __init__(self, site: pywikibot.site.APISite) -> None:
+        self.site = site
+        self.page = pywikibot.Page(site, "Wikipedia:WikiProjekt Begrüßung von Neulingen/Begrüßungsteam")
+        self.lock = threading.Lock()
+        self.fetchTime: Optional[float] = None
+        self.greeterSignatures: List[Tuple[pywikibot.User, str]] = []
+        self.greetersToNotify: Set[str] = set()
+
+    def parseGreeterSignatures(self, text: str) -> List[Tuple[pywikibot.User, str]]:
+        greeterSignatures: List[Tuple[pywikibot.User, str]] = []
+        seenGreeters: Set[str] = set()
+        for match in greeterLineRegex.finditer(getSectionText(text, teamSectionHeaderRegex)):
+            signatureWithoutTimestamp = match.group(1)
+            if not signatureWithoutTimestamp:
+                pywikibot.warning(f"Could not parse greeter line: '{match.group()}''")
+                continue
+            user = getUserFromSignature(self.site, signatureWithoutTimestamp)
+            if not user:
+                pywikibot.warning(f"Could not extract greeter name from signature '{signatureWithoutTimestamp}'")
+            elif user.username in seenGreeters:
+                pywikibot.warning(f"Duplicate greeter '{user.username}''")
+            else:
+                greeterSignatures.append((user, signatureWithoutTimestamp))
+                seenGreeters.add(user.username)
+        return greeterSignatures
+
+    def parseGreetersToNotify(self, text: str) -> Set[str]:
+        greetersToNotify: Set[str] = set()
+        for match in notifyLineRegex.finditer(getSectionText(text, notifySectionHeaderRegex)):
+            user = getUserFromSignature(self.site, match.group())
+            if not user:
+                pywikibot.warning(f"Could not extract greeter name from notify line '{match.group()}'")
+            else:
+                greetersToNotify.add(user.username)
+        return greetersToNotify
+
+    def refreshIfStale(self, maxAge: float) -> None:
+        # must be called with self.lock held
+        if self.fetchTime is not None and time.monotonic() - self.fetchTime < maxAge:
+            return
+        text = self.page.get(force=True)
+        self.greeterSignatures = self.parseGreeterSignatures(text)
+        self.greetersToNotify = self.parseGreetersToNotify(text)
+        self.fetchTime = time.monotonic()
+
+    def getGreeterSignatures(self, maxAge: float) -> List[Tuple[pywikibot.User, str]]:
+        with self.lock:
+            self.refreshIfStale(maxAge)
+            return self.greeterSignatures
+
+    def getGreetersToNotify(self, maxAge: float) -> Set[str]:
+        with self.lock:
+            self.refreshIfStale(maxAge)
+            return self.greetersToNotify
 
 
 class GreetController:
-    def __init__(self, site: pywikibot.site.APISite, redisDb: RedisDb, secret: str) -> None:
+    def __init__(self, site: pywikibot.site.APISite, redisDb: RedisDb, projectPage: ProjectPage, secret: str) -> None:
         self.greeters: List[Greeter]
         self.allGreetersSet: Set[str]
         self.site = site
         self.redisDb = redisDb
+        self.projectPage = projectPage
         self.secret = secret
+        # hash state with the secret prefix already absorbed, copied for every user
+        self.controlGroupHashPrefix = hashlib.sha224(secret.encode("utf-8"))
+        # title -> (revision id, text) of pages last read or written by the bot
+        self.pageCache: Dict[str, Tuple[int, str]] = {}
+        # the MediaWiki API probes are I/O-bound and are run concurrently on this pool
+        self.executor = ThreadPoolExecutor(max_workers=8)
         self.site.login()
 
     def isUserGloballyLocked(self, user: pywikibot.User) -> bool:
@@ -190,73 +438,126 @@ class GreetController:
         response = globallyLockedRequest.submit()
         return "locked" in response["query"]["globaluserinfo"]
 
-    def isEligibleAsGreeter(self, greeter: pywikibot.User) -> bool:
-        if not greeter.isRegistered():
+    def isEligibleAsGreeter(
+        self, greeter: pywikibot.User, userInfo: Dict[str, Any], talkPageInfo: Dict[str, Any], cutoffTime: datetime
+    ) -> bool:
+        if "missing" in userInfo or "invalid" in userInfo:
             pywikibot.warning(f"Greeter '{greeter.username}' does not exist.")
             return False
-        if greeter.isBlocked():
+        if "blockid" in userInfo:
             pywikibot.warning(f"'{greeter.username}' is blocked and thus not eligible as greeter.")
             return False
-        if self.isUserGloballyLocked(greeter):
-            pywikibot.warning(f"'{greeter.username}' is globally locked and thus not eligible as greeter.")
-            return False
-        if not "review" in greeter.getprops()["rights"]:
+        if "review" not in userInfo.get("rights", []):
             pywikibot.warning(f"'{greeter.username}' does not have review rights and is thus not eligible as greeter.")
             return False
-        if greeter.getUserTalkPage().protection():
+        if talkPageInfo.get("protection"):
             # Talk page is protected, thus not eligible as greeter
             return False
         if not inProduction and greeter.username != "Count Count":
             return False
-        cutoffTime = datetime.now() - timedelta(hours=24)
+        # the remaining checks need an API request each, the activity check rules out the most greeters
         lastActivityTimestamp = greeter.last_event.timestamp()
         if lastActivityTimestamp < cutoffTime:
             # not active in the last 24 hours and is thus not eligible as greeter
             return False
+        if self.isUserGloballyLocked(greeter):
+            pywikibot.warning(f"'{greeter.username}' is globally locked and thus not eligible as greeter.")
+            return False
         return True
 
-    def reloadGreeters(self) -> None:
-        self.greeters = []
-        self.allGreetersSet = set()
-        projectPage = pywikibot.Page(self.site, "Wikipedia:WikiProjekt Begrüßung von Neulingen/Begrüßungsteam")
-        inSection = False
-        greetersSet: Set[str] = set()
-        for line in projectPage.get(force=True).split("\n"):
-            if inSection:
-                if line.startswith("="):
+    def reloadGreeters(self, now: datetime) -> None:
+        candidates = self.projectPage.getGreeterSignatures(maxAge=0)
+        self.allGreetersSet = {user.username for (user, _) in candidates}
+        candidateUsers = [user for (user, _) in candidates]
+        userInfos = self.getUserInfos(candidateUsers, "blockinfo|rights|gender")
+        talkPageInfos = self.getTalkPageInfos(candidateUsers, "protection")
+        # greeters must have been active in the last 24 hours
+        activityCutoffTime = now - timedelta(hours=24)
+        eligibleStates = list(
+            self.executor.map(
+                lambda user: self.isEligibleAsGreeter(
+                    user, userInfos[user.username], talkPageInfos[user.username], activityCutoffTime
+                ),
+                candidateUsers,
+            )
+        )
+        self.greeters = [
+            Greeter(
+                user,
+                signatureWithoutTimestamp,
+                "Benutzerin Diskussion:"
+                if userInfos[user.username].get("gender") == "female"
+                else "Benutzer Diskussion:",
+            )
+            for ((user, signatureWithoutTimestamp), eligible) in zip(candidates, eligibleStates)
+            if eligible
+        ]
+
+    def getUserInfos(self, users: List[pywikibot.User], usprop: str) -> Dict[str, Dict[str, Any]]:
+        userInfos: Dict[str, Dict[str, Any]] = {}
+        for batch in chunked(users):
+            userInfoRequest = pywikibot.data.api.Request(
+                site=self.site,
+                parameters={
+                    "action": "query",
+                    "format": "json",
+                    "list": "users",
+                    "ususers": "|".join(user.username for user in batch),
+                    "usprop": usprop,
+                },
+            )
+            response = userInfoRequest.submit()
+            for userInfo in response["query"]["users"]:
+                userInfos[userInfo["name"]] = userInfo
+        # users unknown to the API are treated like missing users
+        return {user.username: userInfos.get(user.username, {"missing": ""}) for user in users}
+
+    def getTalkPageInfos(self, users: List[pywikibot.User], inprop: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        talkPageInfos: Dict[str, Dict[str, Any]] = {}
+        for batch in chunked(users):
+            talkPageTitles = {user.getUserTalkPage().title(): user.username for user in batch}
+            parameters = {"action": "query", "format": "json", "prop": "info", "titles": "|".join(talkPageTitles)}
+            if inprop:
+                parameters["inprop"] = inprop
+            talkPageInfoRequest = pywikibot.data.api.Request(site=self.site, parameters=parameters)
+            response = talkPageInfoRequest.submit()
+            normalized = {entry["from"]: entry["to"] for entry in response["query"].get("normalized", [])}
+            pagesByTitle = {page["title"]: page for page in response["query"]["pages"].values()}
+            for (title, username) in talkPageTitles.items():
+                talkPageInfos[username] = pagesByTitle[normalized.get(title, title)]
+        return talkPageInfos
+
+    def getBlockedUsers(self, users: List[pywikibot.User]) -> Set[str]:
+        userInfos = self.getUserInfos(users, "blockinfo")
+        return {username for (username, userInfo) in userInfos.items() if "blockid" in userInfo}
+
+    def getUsersWithExistingTalkPage(self, users: List[pywikibot.User]) -> Set[str]:
+        return {username for (username, pageInfo) in self.getTalkPageInfos(users).items() if "missing" not in pageInfo}
+
+    def getGloballyLockedUsers(self, users: List[pywikibot.User]) -> Set[str]:
+        # meta=globaluserinfo only accepts a single user, so the lookups are issued concurrently instead
+        lockedStates = list(self.executor.map(self.isUserGloballyLocked, users))
+        return {user.username for (user, locked) in zip(users, lockedStates) if locked}
+
+    def getUsersWithContributions(self, users: List[pywikibot.User]) -> Set[str]:
+        usersWithContributions: Set[str] = set()
+        for batch in chunked(users):
+            batchUsernames = {user.username for user in batch}
+            # contributions of all users in the batch are listed together, stop as soon as every user has one
+            for contrib in self.site.usercontribs(user="|".join(sorted(batchUsernames))):
+                usersWithContributions.add(contrib["user"])
+                if batchUsernames <= usersWithContributions:
                     break
-                elif line.startswith("#"):
-                    match = re.match(
-                        r"#\s*(.+) [0-9]{2}:[0-9]{2}, [123]?[0-9]\. (?:Jan\.|Feb\.|Mär\.|Apr\.|Mai|Jun\.|Jul\.|Aug\.|Sep\.|Okt\.|Nov\.|Dez\.) 2[0-9]{3} \((CES?T|MES?Z)\)",
-                        line,
-                    )
-                    if match:
-                        signatureWithoutTimestamp = match.group(1)
-                        user = getUserFromSignature(self.site, signatureWithoutTimestamp)
-                        if not user:
-                            pywikibot.warning(
-                                f"Could not extract greeter name from signature '{signatureWithoutTimestamp}'"
-                            )
-                        else:
-                            if user.username in greetersSet:
-                                pywikibot.warning(f"Duplicate greeter '{user.username}''")
-                            elif self.isEligibleAsGreeter(user):
-                                greetersSet.add(user.username)
-                                self.greeters.append(Greeter(user, signatureWithoutTimestamp))
-                            self.allGreetersSet.add(user.username)
-                    else:
-                        pywikibot.warning(f"Could not parse greeter line: '{line}''")
-            elif re.match(r"==\s*Begrüßungsteam\s*==\s*", line):
-                inSection = True
-
-    def getUsersToGreet(self) -> List[pywikibot.User]:
+        return usersWithContributions
+
+    def getUsersToGreet(self, start: datetime, end: datetime) -> List[pywikibot.User]:
         logevents = self.site.logevents(
             logtype="newusers",
-            start=datetime.utcnow() - timedelta(hours=24),
-            end=datetime.utcnow() - timedelta(hours=6),
+            start=start,
+            end=end,
             reverse=True,
         )
-        usersToGreet = []
+        candidates: List[pywikibot.User] = []
         for logevent in logevents:
             if logevent.action() == "create":  # only locally registered new users, no SUL
                 try:
@@ -265,55 +566,64 @@ class GreetController:
                     # User name hidden/oversighted
                     continue
 
-                if user.isBlocked():
-                    # User is blocked and will not be greeted.
-                    pass
-                elif self.isUserGloballyLocked(user):
-                    # User is globally locked and will not be greeted.
-                    pass
-                elif user.getUserTalkPage().exists():
-                    # User talk page exists, will thus not be greeted.
-                    pass
-                elif inProduction and not timezone.localize(datetime(2019, 12, 2, 0, 0)) < logevent.timestamp().replace(
+                if inProduction and not timezone.localize(datetime(2019, 12, 2, 0, 0)) < logevent.timestamp().replace(
                     tzinfo=pytz.utc
                 ).astimezone(timezone) < timezone.localize(datetime(2020, 1, 27, 0, 0)):
                     # only greet users registered in eight week test period
-                    pass
-                else:
-                    usersToGreet.append(user)
+                    continue
+                candidates.append(user)
+
+        blockedUsers = self.getBlockedUsers(candidates)
+        usersWithTalkPage = self.getUsersWithExistingTalkPage(candidates)
+        notGreetedAnyway = blockedUsers | usersWithTalkPage
+        lockedUsers = self.getGloballyLockedUsers(
+            [user for user in candidates if user.username not in notGreetedAnyway]
+        )
+        usersToGreet = []
+        for user in candidates:
+            if user.username in blockedUsers:
+                # User is blocked and will not be greeted.
+                pass
+            elif user.username in lockedUsers:
+                # User is globally locked and will not be greeted.
+                pass
+            elif user.username in usersWithTalkPage:
+                # User talk page exists, will thus not be greeted.
+                pass
+            else:
+                usersToGreet.append(user)
 
         return usersToGreet
 
-    def logGreetings(self, greeter: pywikibot.User, users: List[pywikibot.User]) -> None:
+    def logGreetings(
+        self, greeter: pywikibot.User, users: List[pywikibot.User], usersWithContributions: Set[str]
+    ) -> Tuple[str, Optional[str]]:
         logPageTitle = getLogPageTitle(greeter.username)
         logPage = pywikibot.Page(self.site, logPageTitle)
-        text = logPage.get(force=True) if logPage.exists() else ""
+        text = self.getPageTexts([logPage])[logPage.title()]
         text = ensureHeaderForLogExists(text, greeter.username)
         text = ensureDateSectionExists(text)
-        for user in users:
-            text += f"\n* {{{{Benutzer|{user.username}}}}}"
-        logPage.text = text
+        newText = "".join([text] + [f"\n* {{{{Benutzer|{user.username}}}}}" for user in users])
+        logPage.text = newText
         logPage.save(summary="Bot: Logeinträge für neue Begrüßungen hinzugefügt.", watch=False)
-        mainLogPage = pywikibot.Page(self.site, f"Wikipedia:WikiProjekt Begrüßung von Neulingen/Begrüßungslogbuch")
-        ensureIncludedAsTemplate(mainLogPage, logPageTitle)
-        usersWithContribsText = ""
-        for user in users:
-            if len(list(user.contributions(total=1))) != 0:
-                usersWithContribsText += f"\n{{{{subst:Wikipedia:WikiProjekt Begrüßung von Neulingen/Vorlage:BegrüßterHatBereitsVorherEditiert|1={user.username}}}}}"
+        self.cacheSavedPageText(logPage, newText)
+        usersWithContribsText = "".join(
+            f"\n{{{{subst:Wikipedia:WikiProjekt Begrüßung von Neulingen/Vorlage:BegrüßterHatBereitsVorherEditiert|1={user.username}}}}}"
+            for user in users
+            if user.username in usersWithContributions
+        )
         if len(usersWithContribsText) > 0:
             contributionsLogPageTitle = getContributionsLogPageTitle(greeter.username)
             contributionsLogPage = pywikibot.Page(self.site, contributionsLogPageTitle)
-            contributionsLogText = contributionsLogPage.get(force=True) if contributionsLogPage.exists() else ""
+            # the page is saved with subst: templates, so the saved text cannot be cached, reading it is still cheaper
+            contributionsLogText = self.getPageTexts([contributionsLogPage])[contributionsLogPage.title()]
             contributionsLogText = ensureHeaderForContributionLogExists(contributionsLogText, greeter.username)
             contributionsLogText = ensureDateSectionExists(contributionsLogText)
             summary = "Bot: Bereits erfolgte Bearbeitungen von begrüßten Benutzers protokolliert."
-            contributionsLogText += usersWithContribsText
-            contributionsLogPage.text = contributionsLogText
+            contributionsLogPage.text = contributionsLogText + usersWithContribsText
             contributionsLogPage.save(summary=summary)
-            mainLogPage = pywikibot.Page(
-                self.site, f"Wikipedia:WikiProjekt Begrüßung von Neulingen/Bearbeitungen von Begrüßten"
-            )
-            ensureIncludedAsTemplate(mainLogPage, contributionsLogPageTitle)
+            return (logPageTitle, contributionsLogPageTitle)
+        return (logPageTitle, None)
 
     def greet(self, greeter: Greeter, user: pywikibot.User) -> None:
         pywikibot.output(f"Greeting '{user.username}' as '{greeter.user.username}'")
@@ -321,10 +631,7 @@ class GreetController:
         if userTalkPage.exists():
             pywikibot.warning(f"User talk page of {user.username} was created suddenly")
             raise TalkPageExistsException()
-        greeterTalkPagePrefix = (
-            "Benutzerin Diskussion:" if greeter.user.gender() == "female" else "Benutzer Diskussion:"
-        )
-        greeterTalkPage = greeterTalkPagePrefix + greeter.user.username
+        greeterTalkPage = greeter.talkPagePrefix + greeter.user.username
         userTalkPage.text = (
             f"{{{{subst:Wikipedia:WikiProjekt Begrüßung von Neulingen/Vorlage:Willkommen|1="
             f"{greeter.signatureWithoutTimestamp}|2={greeter.user.username}|3={greeterTalkPage}}}}}"
@@ -332,50 +639,134 @@ class GreetController:
         userTalkPage.save(summary="Bot: Herzlich Willkommen bei Wikipedia!", watch=False)
         self.redisDb.addGreetedUser(greeter.user.username, user.username)
 
-    def greetAll(self, users: List[pywikibot.User]) -> List[pywikibot.User]:
-        greetings: Dict[pywikibot.User, List[pywikibot.User]] = {}
-        greetedUsers: List[pywikibot.User] = []
-        for user in users:
-            greeter = random.choice(self.greeters)
-            try:
-                self.greet(greeter, user)
-            except TalkPageExistsException:
-                continue
-            except Exception:
-                pywikibot.error(
-                    f"Error greeting '{user.username}' as '{greeter.user.username}': {traceback.format_exc()}"
-                )
-                continue
-            greetedUsers.append(user)
-            if not greeter.user in greetings:
-                greetings[greeter.user] = []
-            greetings[greeter.user].append(user)
+    def tryGreet(self, greeter: Greeter, user: pywikibot.User) -> Optional[bool]:
+        # True if the user was greeted, False if the user is not to be greeted any more, None on errors
+        try:
+            self.greet(greeter, user)
+        except TalkPageExistsException:
+            return False
+        except Exception:
+            pywikibot.error(f"Error greeting '{user.username}' as '{greeter.user.username}': {traceback.format_exc()}")
+            return None
+        return True
 
-        for (k, v) in greetings.items():
-            self.logGreetings(k, v)
+    def greetAll(self, users: List[pywikibot.User]) -> Tuple[List[pywikibot.User], bool]:
+        # returns the greeted users and whether all users were handled without errors
+        greetings: DefaultDict[pywikibot.User, List[pywikibot.User]] = defaultdict(list)
+        greetedUsers: List[pywikibot.User] = []
+        # draw distinct greeters as long as there are enough of them to spread the log page writes
+        if len(users) <= len(self.greeters):
+            assignedGreeters = random.sample(self.greeters, k=len(users))
+        else:
+            assignedGreeters = random.choices(self.greeters, k=len(users))
+        # every user has a different talk page, so the greetings are saved concurrently,
+        # pywikibot's put throttle still paces the edits
+        greetResults = list(self.executor.map(self.tryGreet, assignedGreeters, users))
+        for (user, greeter, greeted) in zip(users, assignedGreeters, greetResults):
+            if greeted:
+                greetedUsers.append(user)
+                greetings[greeter.user].append(user)
+
+        usersWithContributions = self.getUsersWithContributions(greetedUsers)
+        # the log pages of different greeters are independent and can be written concurrently,
+        # the main log pages shared by all greeters are only updated afterwards
+        writtenLogPageTitles = list(
+            self.executor.map(
+                lambda greeting: self.logGreetings(greeting[0], greeting[1], usersWithContributions), greetings.items()
+            )
+        )
+        mainLogPage = pywikibot.Page(self.site, f"Wikipedia:WikiProjekt Begrüßung von Neulingen/Begrüßungslogbuch")
+        mainContributionsLogPage = pywikibot.Page(
+            self.site, f"Wikipedia:WikiProjekt Begrüßung von Neulingen/Bearbeitungen von Begrüßten"
+        )
+        if writtenLogPageTitles:
+            self.ensureIncludedInMainPage(mainLogPage, [logPageTitle for (logPageTitle, _) in writtenLogPageTitles])
+        contributionsLogPageTitles = [title for (_, title) in writtenLogPageTitles if title]
+        if contributionsLogPageTitles:
+            self.ensureIncludedInMainPage(mainContributionsLogPage, contributionsLogPageTitles)
 
-        return greetedUsers
+        return (greetedUsers, None not in greetResults)
 
     def isInControlGroup(self, user: pywikibot.User) -> bool:
-        digest = hashlib.sha224((self.secret + user.username).encode("utf-8")).digest()
-        return digest[0] % 128 < 64
-
-    def logGroup(self, page: pywikibot.Page, users: List[pywikibot.User]) -> None:
-        text = page.get(force=True) if page.exists() else ""
+        userHash = self.controlGroupHashPrefix.copy()
+        userHash.update(user.username.encode("utf-8"))
+        # same as digest[0] % 128 < 64: bit 6 of the first byte decides the group
+        return userHash.digest()[0] & 0x40 == 0
+
+    def getPageTexts(self, pages: List[pywikibot.Page]) -> Dict[str, str]:
+        # one query for the ids and timestamps of the current revisions tells which cached texts are still current,
+        # only changed pages are downloaded
+        revisionsRequest = pywikibot.data.api.Request(
+            site=self.site,
+            parameters={
+                "action": "query",
+                "format": "json",
+                "prop": "revisions",
+                "rvprop": "ids|timestamp",
+                "titles": "|".join(page.title() for page in pages),
+            },
+        )
+        response = revisionsRequest.submit()
+        normalized = {entry["from"]: entry["to"] for entry in response["query"].get("normalized", [])}
+        pageInfos = {pageInfo["title"]: pageInfo for pageInfo in response["query"]["pages"].values()}
+        texts: Dict[str, str] = {}
+        for page in pages:
+            title = page.title()
+            pageInfo = pageInfos[normalized.get(title, title)]
+            if "missing" in pageInfo:
+                texts[title] = ""
+                continue
+            revision = pageInfo["revisions"][0]
+            cachedPage = self.pageCache.get(title)
+            if cachedPage and cachedPage[0] == revision["revid"]:
+                texts[title] = cachedPage[1]
+                # the cached revision is loaded onto the page, so that saving it neither downloads the text again
+                # nor loses the edit conflict detection for edits after this query
+                page._revisions[revision["revid"]] = pywikibot.page.Revision(  # type: ignore
+                    revid=revision["revid"],
+                    timestamp=pywikibot.Timestamp.fromISOformat(revision["timestamp"]),
+                    user="",
+                    text=cachedPage[1],
+                )
+                page.latest_revision_id = revision["revid"]
+            else:
+                texts[title] = page.get(force=True)
+                self.pageCache[title] = (page.latest_revision_id, texts[title])
+        return texts
+
+    def cacheSavedPageText(self, page: pywikibot.Page, text: str) -> None:
+        # only for texts saved without subst:, they are what MediaWiki stores (minus trailing whitespace),
+        # page.text must not be used here as pywikibot clears it on save and would load it again,
+        # the timestamp of the saved revision is unknown, a hit for it in getPageTexts loads it with the timestamp
+        # returned there, so that the next save of the page is still checked against this revision
+        self.pageCache[page.title()] = (page.latest_revision_id, text.rstrip())
+
+    def ensureIncludedInMainPage(self, mainLogPage: pywikibot.Page, subLogPageTitles: List[str]) -> None:
+        text = self.getPageTexts([mainLogPage])[mainLogPage.title()]
+        newText = ensureIncludedAsTemplates(mainLogPage, subLogPageTitles, text)
+        if newText is not None:
+            self.cacheSavedPageText(mainLogPage, newText)
+
+    def logGroup(self, page: pywikibot.Page, text: str, users: List[pywikibot.User]) -> None:
+        loggedUsernames = set(groupLineRegex.findall(text))
+        newLines: List[str] = []
         for user in users:
-            newLine = f"\n* [[Benutzer:{user.username}|{user.username}]]"
-            if not newLine in text:
-                text += newLine
-        page.text = text
+            if user.username not in loggedUsernames:
+                loggedUsernames.add(user.username)
+                newLines.append(f"\n* [[Benutzer:{user.username}|{user.username}]]")
+        newText = "".join([text] + newLines)
+        page.text = newText
         page.save(summary=f"Bot: Benutzerliste nach Botlauf aktualisiert.")
+        self.cacheSavedPageText(page, newText)
 
     def logGroups(self, greetedUsers: List[pywikibot.User], controlGroup: List[pywikibot.User]) -> None:
-        self.logGroup(
-            pywikibot.Page(self.site, "Wikipedia:WikiProjekt Begrüßung von Neulingen/Begrüßte Benutzer"), greetedUsers
-        )
-        self.logGroup(
-            pywikibot.Page(self.site, "Wikipedia:WikiProjekt Begrüßung von Neulingen/Kontrollgruppe"), controlGroup
+        greetedUsersPage = pywikibot.Page(
+            self.site, "Wikipedia:WikiProjekt Begrüßung von Neulingen/Begrüßte Benutzer"
         )
+        controlGroupPage = pywikibot.Page(self.site, "Wikipedia:WikiProjekt Begrüßung von Neulingen/Kontrollgruppe")
+        texts = self.getPageTexts([greetedUsersPage, controlGroupPage])
+        self.logGroup(greetedUsersPage, texts[greetedUsersPage.title()], greetedUsers)
+        self.logGroup(controlGroupPage, texts[controlGroupPage.title()], controlGroup)
 
     def createGreeterSpecificPages(self, greeter: str) -> None:
         logPageTitle = getLogPageTitle(greeter)
@@ -384,31 +775,49 @@ class GreetController:
             text = ensureHeaderForLogExists("", greeter)
             logPage.text = text
             logPage.save(summary="Bot: Seite für Begrüßer angelegt.", watch=False)
-        mainLogPage = pywikibot.Page(self.site, f"Wikipedia:WikiProjekt Begrüßung von Neulingen/Begrüßungslogbuch")
-        ensureIncludedAsTemplate(mainLogPage, logPageTitle)
         contributionsLogPageTitle = getContributionsLogPageTitle(greeter)
         contributionsLogPage = pywikibot.Page(self.site, contributionsLogPageTitle)
         if not contributionsLogPage.exists():
             contributionsLogText = ensureHeaderForContributionLogExists("", greeter)
             contributionsLogPage.text = contributionsLogText
             contributionsLogPage.save(summary="Bot: Seite für Begrüßer angelegt.")
-        mainLogPage = pywikibot.Page(
-            self.site, f"Wikipedia:WikiProjekt Begrüßung von Neulingen/Bearbeitungen von Begrüßten"
-        )
-        ensureIncludedAsTemplate(mainLogPage, contributionsLogPageTitle)
 
     def createAllGreeterSpecificPages(self) -> None:
-        self.reloadGreeters()
+        self.reloadGreeters(datetime.utcnow())
         for greeter in self.allGreetersSet:
             self.createGreeterSpecificPages(greeter)
+        # the main pages are read and saved once for all greeters
+        mainLogPage = pywikibot.Page(self.site, f"Wikipedia:WikiProjekt Begrüßung von Neulingen/Begrüßungslogbuch")
+        self.ensureIncludedInMainPage(
+            mainLogPage, [getLogPageTitle(greeter) for greeter in sorted(self.allGreetersSet)]
+        )
+        mainContributionsLogPage = pywikibot.Page(
+            self.site, f"Wikipedia:WikiProjekt Begrüßung von Neulingen/Bearbeitungen von Begrüßten"
+        )
+        self.ensureIncludedInMainPage(
+            mainContributionsLogPage,
+            [getContributionsLogPageTitle(greeter) for greeter in sorted(self.allGreetersSet)],
+        )
 
     def doGreetRun(self) -> None:
         pywikibot.output("Starting greet run...")
-        self.reloadGreeters()
-        pywikibot.output(f"Eligible greeters: {sorted(greeter.user.username for greeter in self.greeters)}")
-        allUsers = self.getUsersToGreet()
+        now = datetime.utcnow()
+        # users are greeted 6 to 24 hours after registration, registrations handled by an earlier run are skipped
+        windowStart = now - timedelta(hours=24)
+        windowEnd = now - timedelta(hours=6)
+        cursor = self.redisDb.getGreetRunCursor()
+        if cursor and cursor > windowStart:
+            windowStart = cursor
+        allUsers = self.getUsersToGreet(windowStart, windowEnd)
+        if not allUsers:
+            if inProduction:
+                self.redisDb.setGreetRunCursor(windowEnd)
+            pywikibot.output("No new users to greet, finished greet run.")
+            return
         if not inProduction:
             allUsers = allUsers[:10]
+        self.reloadGreeters(now)
+        pywikibot.output(f"Eligible greeters: {sorted(greeter.user.username for greeter in self.greeters)}")
         usersToGreet: List[pywikibot.User] = []
         controlGroup: List[pywikibot.User] = []
         for user in allUsers:
@@ -418,27 +827,48 @@ class GreetController:
         pywikibot.output(
             f"Greeting {len(usersToGreet)} users with {len(self.greeters)} greeters (control group: {len(controlGroup)} users)..."
         )
-        greetedUsers = self.greetAll(usersToGreet)
+        (greetedUsers, allUsersHandled) = self.greetAll(usersToGreet)
         for user in controlGroup:
             self.redisDb.addControlGroupUser(user.username)
         self.logGroups(greetedUsers, controlGroup)
+        # users dropped by the test mode limit or not greeted because of an error are considered again in the next run
+        if inProduction and allUsersHandled:
+            self.redisDb.setGreetRunCursor(windowEnd)
         pywikibot.output("Finished greet run.")
 
     def run(self) -> None:
+        runInterval = 30 * 60
+        failedRuns = 0
         while True:
+            runStart = time.monotonic()
             if 8 <= datetime.now(timezone).hour < 22:
                 try:
                     self.doGreetRun()
+                    failedRuns = 0
                 except Exception:
                     pywikibot.error(f"Error during greeting run: {traceback.format_exc()}")
-            time.sleep(30 * 60)
+                    failedRuns += 1
+            else:
+                # the backoff of failed runs in the evening does not apply to the first run in the morning
+                failedRuns = 0
+            if failedRuns:
+                # retry failed runs with exponential backoff starting at one minute
+                time.sleep(min(60 * 2 ** (failedRuns - 1), runInterval))
+            else:
+                # keep the start of runs at a fixed interval regardless of how long a run took
+                time.sleep(max(0, runInterval - (time.monotonic() - runStart)))
 
 
 class GreetedUserWatchBot(SingleSiteBot):
-    def __init__(self, site: pywikibot.site.APISite, redisDb: RedisDb) -> None:
+    def __init__(self, site: pywikibot.site.APISite, redisDb: RedisDb, projectPage: ProjectPage) -> None:
         super(GreetedUserWatchBot, self).__init__(site=site)
         self.redisDb = redisDb
-        self.generator = FaultTolerantLiveRCPageGenerator(self.site)
+        self.projectPage = projectPage
+        self.generator = FaultTolerantLiveRCPageGenerator(self.site, self.isRelevantChange)
+
+    def isRelevantChange(self, change: Dict[str, Any]) -> bool:
+        # most events are log entries or edits by users who were never greeted
+        return change["type"] in ("edit", "new") and self.redisDb.isPossiblyGreetedUser(change["user"])
 
     def skip_page(self, page: pywikibot.Page) -> bool:
         if page.namespace() < 0:
@@ -448,21 +878,8 @@ class GreetedUserWatchBot(SingleSiteBot):
         return super().skip_page(page)
 
     def greeterWantsToBeNotifiedOnTalkPage(self, greeter: str) -> bool:
-        projectPage = pywikibot.Page(self.site, "Wikipedia:WikiProjekt Begrüßung von Neulingen/Begrüßungsteam")
-        inSection = False
-        for line in projectPage.get(force=True).split("\n"):
-            if inSection:
-                if line.startswith("="):
-                    break
-                elif line.startswith("*"):
-                    user = getUserFromSignature(self.site, line)
-                    if not user:
-                        pywikibot.warning(f"Could not extract greeter name from notify line '{line}'")
-                    elif user.username == greeter:
-                        return True
-            elif re.match(r"===\s*Benachrichtigung über Antworten\s*===\s*", line):
-                inSection = True
-        return False
+        # the project page rarely changes, so it is parsed at most every five minutes
+        return greeter in self.projectPage.getGreetersToNotify(maxAge=5 * 60)
 
     def saveNotificationInProject(self, greeter: str, username: str, newRevision: int, ownTalkPageEdit: bool) -> None:
         contributionsLogPageTitle = getContributionsLogPageTitle(greeter)
@@ -497,9 +914,6 @@ class GreetedUserWatchBot(SingleSiteBot):
 
     def treat(self, page: pywikibot.Page) -> None:
         change = page._rcinfo
-        if not (change["type"] == "edit" or change["type"] == "new"):
-            return
-
         username = change["user"]
         greetedUserInfo = self.redisDb.getGreetedUserInfo(username)
         if greetedUserInfo:
@@ -515,53 +929,82 @@ class GreetedUserWatchBot(SingleSiteBot):
                 self.notifyGreeter(greetedUserInfo["greeter"], username, newRevision, True)
             elif greetedUserInfo["normalEditSeen"] == "0":
                 # user edited somewhere else for the first time after being greeted
-                greetedUserInfo["normalEditSeen"] = "1"
-                self.redisDb.setGreetedUserInfo(username, greetedUserInfo)
+                self.redisDb.markNormalEditSeen(username)
                 self.notifyGreeter(greetedUserInfo["greeter"], username, newRevision, False)
 
 
-def runWatchBot(site: pywikibot.site.APISite, redisDb: RedisDb) -> None:
+def runWatchBot(site: pywikibot.site.APISite, redisDb: RedisDb, projectPage: ProjectPage) -> None:
     while True:
         try:
-            GreetedUserWatchBot(site, redisDb).run()
+            GreetedUserWatchBot(site, redisDb, projectPage).run()
         except Exception:
             pywikibot.error(f"Error watching greeted users: {traceback.format_exc()}")
             time.sleep(60)
 
 
-def startWatchBot(site: pywikibot.site.APISite, redisDb: RedisDb) -> None:
-    threading.Thread(target=runWatchBot, args=[site, redisDb]).start()
+def startWatchBot(site: pywikibot.site.APISite, redisDb: RedisDb, projectPage: ProjectPage) -> None:
+    threading.Thread(target=runWatchBot, args=[site, redisDb, projectPage]).start()
+
+
+def monkey_patch(site: pywikibot.site.APISite) -> None:
+    # pywikibot polls every 250 ms while a page is locked by another thread, wait for a notification instead
+    if not hasattr(site, "_pagecond"):
+        if isinstance(site._pagemutex, threading.Condition):
+            site._pagecond = site._pagemutex
+        else:
+            site._pagecond = threading.Condition(site._pagemutex)
+    if not isinstance(site._locked_pages, set):
+        site._locked_pages = set(site._locked_pages)
+
+    def lock_page(page: pywikibot.Page, block: bool = True) -> None:
+        title = page.title(with_section=False)
+        with site._pagecond:
+            while title in site._locked_pages:
+                if not block:
+                    raise pywikibot.site.PageInUse(title)
+                site._pagecond.wait()
+            site._locked_pages.add(title)
+
+    def unlock_page(page: pywikibot.Page) -> None:
+        with site._pagecond:
+            site._locked_pages.discard(page.title(with_section=False))
+            site._pagecond.notify_all()
+
+    site.lock_page = lock_page  # type: ignore
+    site.unlock_page = unlock_page  # type: ignore
 
 
 def main() -> None:
     otherArgs = pywikibot.handle_args()
     locale.setlocale(locale.LC_ALL, "de_DE.utf8")
-    site = cast(pywikibot.site.APISite, pywikibot.Site("de", "wikipedia"))
-    if not inProduction:
-        monkey_patch(site)
+    site: pywikibot.site.APISite = pywikibot.Site("de", "wikipedia")  # type: ignore
+    monkey_patch(site)
     secret = os.environ.get("GREETBOT_SECRET") if inProduction else "12345abcdef"
     if not secret:
         raise Exception("Environment variable GREETBOT_SECRET not set")
     redisDb = RedisDb(secret)
+    # before the watch bot loads the greeted users, a no-op once the old sets are gone
+    redisDb.migrateUserGroups()
+    projectPage = ProjectPage(site)
     if "--create-pages" in otherArgs:
-        GreetController(site, redisDb, secret).createAllGreeterSpecificPages()
+        GreetController(site, redisDb, projectPage, secret).createAllGreeterSpecificPages()
     elif "--list-user-groups" in otherArgs:
         print("Greeted users:")
-        for user in sorted(redisDb.getAllGreetedUsers()):
-            greetedUserInfo = redisDb.getGreetedUserInfo(user)
+        greetedUsers = sorted(redisDb.getAllGreetedUsers())
+        for (user, greetedUserInfo) in zip(greetedUsers, redisDb.getGreetedUserInfos(greetedUsers)):
             print(
                 f"* {user} - {datetime.fromtimestamp(int(greetedUserInfo['time']), tz=timezone)} - "
                 f"{greetedUserInfo['greeter']}"
             )
         print("Control group:")
-        for user in sorted(redisDb.getAllControlGroupUsers()):
-            controlGroupUserInfo = redisDb.getControlGroupUserInfo(user)
+        controlGroupUsers = sorted(redisDb.getAllControlGroupUsers())
+        for (user, controlGroupUserInfo) in zip(controlGroupUsers, redisDb.getControlGroupUserInfos(controlGroupUsers)):
             print(f"* {user} - {datetime.fromtimestamp(int(controlGroupUserInfo['time']), tz=timezone)}")
     elif "--delete-user-groups" in otherArgs:
         redisDb.deleteUserGroups()
     elif "--run-bot" in otherArgs:
-        startWatchBot(site, redisDb)
-        # GreetController(site, redisDb, secret).run()
+        startWatchBot(site, redisDb, projectPage)
+        # GreetController(site, redisDb, projectPage, secret).run()
     elif otherArgs:
         pywikibot.error(f"Unknown args: {otherArgs}")
     else:
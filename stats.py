@@ -1,28 +1,54 @@
+import difflib
 import locale
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, NamedTuple, cast
+from typing import Any, Dict, List, NamedTuple, Set, Tuple, cast
 import pywikibot
 
 
+def stripNamespace(title: str) -> str:
+    # same as title[title.find(":") + 1 :] in a single scan, titles without a colon are returned unchanged
+    (namespace, colon, rest) = title.partition(":")
+    return rest if colon else namespace
+
+
+def getAddedText(oldText: str, newText: str) -> str:
+    # the lines inserted by an edit, usually lines were appended
+    if newText.startswith(oldText) and (not oldText or oldText.endswith("\n") or newText[len(oldText) :][:1] == "\n"):
+        return newText[len(oldText) :]
+    newLines = newText.splitlines()
+    matcher = difflib.SequenceMatcher(None, oldText.splitlines(), newLines, autojunk=False)
+    return "\n".join(
+        line
+        for (tag, _, _, newStart, newEnd) in matcher.get_opcodes()
+        if tag in ("insert", "replace")
+        for line in newLines[newStart:newEnd]
+    )
+
+
 def getUsersAndTimestamps(site: pywikibot.site.BaseSite, page: pywikibot.Page) -> Dict[str, pywikibot.Timestamp]:
-    res = {}
+    res: Dict[str, pywikibot.Timestamp] = {}
     site.loadrevisions(page, starttime=datetime(2019, 12, 2, 0, 0), rvdir=True, content=True)
     actualRevs = page._revisions.values()
     newText = None
     allUsers = set()
     for wikilink in pywikibot.link_regex.finditer(page.text):
-        title = wikilink.group("title").strip()
-        user = title[title.find(":") + 1 :]
+        user = stripNamespace(wikilink.group("title").strip())
         allUsers.add(user)
-    for rev in [x for x in actualRevs]:
-        oldText = page.getOldVersion(rev.parent_id) if not newText else newText
+    # each revision is diffed against the previous one, so the order must not depend on the dict
+    for rev in sorted(actualRevs, key=lambda rev: rev.revid):
+        # only the revision before the first loaded one has to be downloaded, later ones are already loaded
+        if newText is None:
+            oldText = page.getOldVersion(rev.parent_id) if rev.parent_id else ""
+        else:
+            oldText = newText
         newText = rev.text
-        addedText = newText[len(oldText) :]
+        addedText = getAddedText(oldText, newText)
         for wikilink in pywikibot.link_regex.finditer(addedText):
-            title = wikilink.group("title").strip()
-            user = title[title.find(":") + 1 :]
+            user = stripNamespace(wikilink.group("title").strip())
+            # keep the revision a user was first added in, later edits of the line do not change the decision time
             if user in allUsers:
-                res[user] = rev.timestamp
+                res.setdefault(user, rev.timestamp)
     return res
 
 
@@ -39,13 +65,7 @@ EditCounts = NamedTuple(
 )
 
 
-def getEditCounts(site: pywikibot.site.BaseSite, user: pywikibot.User, since: pywikibot.Timestamp) -> EditCounts:
-    edits = 0
-    articleEdits = 0
-    flaggedEdits = 0
-    fvnEdits = 0
-    ownUserTalkPageEdits = 0
-    otherUserTalkPageEdits = 0
+def fetchContribs(site: pywikibot.site.BaseSite, username: str, since: pywikibot.Timestamp) -> List[Dict[str, Any]]:
     contribsRequest = pywikibot.data.api.Request(
         site=site,
         parameters={
@@ -54,27 +74,19 @@ def getEditCounts(site: pywikibot.site.BaseSite, user: pywikibot.User, since: py
             "list": "usercontribs",
             "uclimit": "500",
             "ucend": since.totimestampformat(),
-            "ucuser": user.username,
+            "ucuser": username,
         },
     )
     data = contribsRequest.submit()
-    contribs = data["query"]["usercontribs"]
-    edits = len(contribs)
-    revs = ""
-    for contrib in contribs:
-        if contrib["ns"] == 0:
-            articleEdits += 1
-            if len(revs) != 0:
-                revs += "|"
-            revs += str(contrib["revid"])
-        if contrib["ns"] == pywikibot.site.Namespace.PROJECT and contrib["title"] == "Wikipedia:Fragen von Neulingen":
-            fvnEdits += 1
-        if contrib["ns"] == pywikibot.site.Namespace.USER_TALK:
-            if contrib["title"][contrib["title"].find(":") + 1 :] == user.username:
-                ownUserTalkPageEdits += 1
-            else:
-                otherUserTalkPageEdits += 1
-    if len(revs) != 0:
+    return cast(List[Dict[str, Any]], data["query"]["usercontribs"])
+
+
+def getFlaggedRevisions(site: pywikibot.site.APISite, revids: List[int]) -> Set[int]:
+    # the revisions of all users are checked together, as many per request as the account may query,
+    # sent as POST because the URL of a GET request with 500 revision ids gets too long
+    batchSize = 500 if site.has_right("apihighlimits") else 50
+    flaggedRevisions = set()
+    for i in range(0, len(revids), batchSize):
         revisionsRequest = pywikibot.data.api.Request(
             site=site,
             parameters={
@@ -82,15 +94,44 @@ def getEditCounts(site: pywikibot.site.BaseSite, user: pywikibot.User, since: py
                 "format": "json",
                 "prop": "revisions|flagged",
                 "rvprop": "flagged|ids",
-                "revids": revs,
+                "revids": "|".join(str(revid) for revid in revids[i : i + batchSize]),
             },
+            use_get=False,
         )
         data = revisionsRequest.submit()
-        pages = data["query"]["pages"]
+        pages = data["query"].get("pages", {})
         for page in pages:
-            for revision in pages[page]["revisions"]:
+            for revision in pages[page].get("revisions", []):
                 if "flagged" in revision:
-                    flaggedEdits += 1
+                    flaggedRevisions.add(revision["revid"])
+    return flaggedRevisions
+
+
+def countEdits(contribs: List[Dict[str, Any]], flaggedRevisions: Set[int]) -> EditCounts:
+    edits = len(contribs)
+    articleEdits = 0
+    flaggedEdits = 0
+    fvnEdits = 0
+    ownUserTalkPageEdits = 0
+    otherUserTalkPageEdits = 0
+    projectNamespace = pywikibot.site.Namespace.PROJECT
+    userTalkNamespace = pywikibot.site.Namespace.USER_TALK
+    for contrib in contribs:
+        ns = contrib["ns"]
+        # every contribution is in exactly one namespace
+        if ns == 0:
+            articleEdits += 1
+            if contrib["revid"] in flaggedRevisions:
+                flaggedEdits += 1
+        elif ns == projectNamespace:
+            if contrib["title"] == "Wikipedia:Fragen von Neulingen":
+                fvnEdits += 1
+        elif ns == userTalkNamespace:
+            # the user name of a contribution is normalized the same way as the title
+            if stripNamespace(contrib["title"]) == contrib["user"]:
+                ownUserTalkPageEdits += 1
+            else:
+                otherUserTalkPageEdits += 1
     return EditCounts(
         edits=edits,
         articleEdits=articleEdits,
@@ -101,55 +142,91 @@ def getEditCounts(site: pywikibot.site.BaseSite, user: pywikibot.User, since: py
     )
 
 
-def isUserGloballyLocked(site, user: pywikibot.User) -> bool:
+def isUserGloballyLocked(site, username: str) -> bool:
     globallyLockedRequest = pywikibot.data.api.Request(
         site=site,
-        parameters={"action": "query", "format": "json", "meta": "globaluserinfo", "guiuser": user.username,},
+        parameters={"action": "query", "format": "json", "meta": "globaluserinfo", "guiuser": username,},
     )
     response = globallyLockedRequest.submit()
     return "locked" in response["query"]["globaluserinfo"]
 
 
+def getBlockedUsers(site: pywikibot.site.APISite, usernames: List[str]) -> Set[str]:
+    # list=users accepts 50 users per request, the returned names are normalized
+    normalizedUsernames = {pywikibot.User(site, username).username: username for username in usernames}
+    normalizedList = list(normalizedUsernames)
+    blockedUsers = set()
+    for i in range(0, len(normalizedList), 50):
+        blockInfoRequest = pywikibot.data.api.Request(
+            site=site,
+            parameters={
+                "action": "query",
+                "format": "json",
+                "list": "users",
+                "usprop": "blockinfo",
+                "ususers": "|".join(normalizedList[i : i + 50]),
+            },
+            use_get=False,
+        )
+        data = blockInfoRequest.submit()
+        for userInfo in data["query"]["users"]:
+            if "blockid" in userInfo:
+                blockedUsers.add(normalizedUsernames[userInfo["name"]])
+    return blockedUsers
+
+
+def processUser(
+    site: pywikibot.site.APISite, username: str, timestamp: pywikibot.Timestamp, isBlocked: bool
+) -> Tuple[bool, List[Dict[str, Any]]]:
+    # meta=globaluserinfo only accepts a single user, so this check stays per user,
+    # locally blocked users are counted as blocked anyway and are not checked
+    return (not isBlocked and isUserGloballyLocked(site, username), fetchContribs(site, username, timestamp))
+
+
 def updateStats() -> None:
     pywikibot.handle_args()
-    site = cast(pywikibot.site.APISite, pywikibot.Site("de", "wikipedia"))
+    site: pywikibot.site.APISite = pywikibot.Site("de", "wikipedia")  # type: ignore
     site.login()
-    controlGroup = getUsersAndTimestamps(
-        site, pywikibot.Page(site, "Wikipedia:WikiProjekt Begrüßung von Neulingen/Kontrollgruppe")
-    )
-    greetedUsers = getUsersAndTimestamps(
-        site, pywikibot.Page(site, "Wikipedia:WikiProjekt Begrüßung von Neulingen/Begrüßte Benutzer")
-    )
+    # the revision histories of the two pages are independent, only their continuations are sequential
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        (controlGroup, greetedUsers) = executor.map(
+            lambda title: getUsersAndTimestamps(site, pywikibot.Page(site, title)),
+            [
+                "Wikipedia:WikiProjekt Begrüßung von Neulingen/Kontrollgruppe",
+                "Wikipedia:WikiProjekt Begrüßung von Neulingen/Begrüßte Benutzer",
+            ],
+        )
+    blockedUsers = getBlockedUsers(site, list(greetedUsers.keys() | controlGroup.keys()))
+    # both groups are looked up in a single pass, users listed in both groups only once
+    allItems = list(dict.fromkeys([*greetedUsers.items(), *controlGroup.items()]))
+    # the API requests of different users are independent, only the waiting for the responses is overlapped
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        userResults = dict(
+            zip(
+                allItems,
+                executor.map(lambda item: processUser(site, item[0], item[1], item[0] in blockedUsers), allItems),
+            )
+        )
+    articleRevisions = {
+        contrib["revid"] for (_, contribs) in userResults.values() for contrib in contribs if contrib["ns"] == 0
+    }
+    flaggedRevisions = getFlaggedRevisions(site, sorted(articleRevisions))
     lines = []
     for (name, group) in {"Begrüßte Personen": greetedUsers, "Kontrollgruppe": controlGroup}.items():
-        blocked = 0
-        total = 0
-        withEdits = 0
-        withArticleEdits = 0
-        withFlaggedEdits = 0
-        usersWithFvnEdits = 0
-        usersWithFlaggedEdits = []
-        usersWithOwnUserTalkPageEdits = 0
-        usersWithOtherUserTalkPageEdits = 0
+        blockedStates: List[bool] = []
+        allEditCounts: List[EditCounts] = []
         for (username, timestamp) in group.items():
-            total += 1
-            user = pywikibot.User(site, username)
-            if user.isBlocked() or isUserGloballyLocked(site, user):
-                blocked += 1
-            editCounts = getEditCounts(site, user, timestamp)
-            if editCounts.edits > 0:
-                withEdits += 1
-            if editCounts.articleEdits > 0:
-                withArticleEdits += 1
-            if editCounts.flaggedEdits > 0:
-                withFlaggedEdits += 1
-                usersWithFlaggedEdits.append(user)
-            if editCounts.fvnEdits > 0:
-                usersWithFvnEdits += 1
-            if editCounts.ownUserTalkPageEdits > 0:
-                usersWithOwnUserTalkPageEdits += 1
-            if editCounts.otherUserTalkPageEdits > 0:
-                usersWithOtherUserTalkPageEdits += 1
+            (isLocked, contribs) = userResults[(username, timestamp)]
+            blockedStates.append(username in blockedUsers or isLocked)
+            allEditCounts.append(countEdits(contribs, flaggedRevisions))
+        total = len(allEditCounts)
+        blocked = sum(blockedStates)
+        withEdits = sum(editCounts.edits > 0 for editCounts in allEditCounts)
+        withArticleEdits = sum(editCounts.articleEdits > 0 for editCounts in allEditCounts)
+        withFlaggedEdits = sum(editCounts.flaggedEdits > 0 for editCounts in allEditCounts)
+        usersWithFvnEdits = sum(editCounts.fvnEdits > 0 for editCounts in allEditCounts)
+        usersWithOwnUserTalkPageEdits = sum(editCounts.ownUserTalkPageEdits > 0 for editCounts in allEditCounts)
+        usersWithOtherUserTalkPageEdits = sum(editCounts.otherUserTalkPageEdits > 0 for editCounts in allEditCounts)
         print(
             f"{name}: Gesamt: {total}, mit Bearbeitungen: {withEdits}, mit ANR-Bearbeitungen: {withArticleEdits}, "
             f"mit gesichteten Bearbeitungen: {withFlaggedEdits}, mit Bearbeitungen auf FvN: {usersWithFvnEdits}, "
@@ -160,8 +237,9 @@ def updateStats() -> None:
             f'| {name} || {total} || {withEdits} || {withArticleEdits} || {withFlaggedEdits} || <span style="color:red;">{blocked}</span>'
         )
         # print(f"{name}: Benutzer mit gesichteten Bearbeitungen")
-        # for user in usersWithFlaggedEdits:
-        # print(f"* {user.username}")
+        # for (username, editCounts) in zip(group.keys(), allEditCounts):
+        #     if editCounts.flaggedEdits > 0:
+        #         print(f"* {username}")
     total = len(greetedUsers) + len(controlGroup)
     print(
         f"Begrüßte Personen : Kontrollgruppe = {len(greetedUsers)/total*100:0.2f}% : {len(controlGroup)/total*100:0.2f}%"